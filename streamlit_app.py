@@ -1,23 +1,213 @@
+import hashlib
 import io
 from difflib import SequenceMatcher
-from typing import Optional
+from typing import Optional, Sequence
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # pragma: no cover - optional dependency
+    fuzz = process = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pacsv = None
+
 TOKYO_CENTER = {"lat": 35.6762, "lon": 139.6503}
+LARGE_UPLOAD_BYTES = 50 * 1024 * 1024
+CSV_CHUNK_ROWS = 100_000
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+RELATED_MIN_SCORE = 0.3
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# st.cache_data is shared by every session, so cached uploads are bounded in
+# number and expire instead of outliving the sessions that uploaded them.
+UPLOAD_CACHE_ENTRIES = 8
+UPLOAD_CACHE_TTL_SECONDS = 60 * 60
+# pandas' default na_values, so Arrow-parsed uploads load missing cells the
+# same way pd.read_csv does.
+CSV_NA_VALUES = [
+    "",
+    "#N/A",
+    "#N/A N/A",
+    "#NA",
+    "-1.#IND",
+    "-1.#QNAN",
+    "-NaN",
+    "-nan",
+    "1.#IND",
+    "1.#QNAN",
+    "<NA>",
+    "N/A",
+    "NA",
+    "NULL",
+    "NaN",
+    "None",
+    "n/a",
+    "nan",
+    "null",
+]
+
+
+def _arrow_convert_options(
+    text_columns: Sequence[str] = (), include_columns: Sequence[str] = ()
+) -> "pacsv.ConvertOptions":
+    """Return Arrow CSV options matching pandas' null handling.
+
+    ``text_columns`` are forced to strings; pandas never parses dates on its
+    own, so columns Arrow infers as temporal are re-read this way. A non-empty
+    ``include_columns`` limits parsing to those columns.
+    """
+    return pacsv.ConvertOptions(
+        null_values=CSV_NA_VALUES,
+        strings_can_be_null=True,
+        column_types={col: pa.string() for col in text_columns},
+        include_columns=list(include_columns),
+    )
 
 
-def load_tabular_file(uploaded_file: io.BytesIO) -> pd.DataFrame:
-    """Return a dataframe from a CSV or Excel file."""
-    filename = uploaded_file.name.lower()
+def _check_arrow_schema(schema: "pa.Schema") -> None:
+    """Raise ArrowInvalid for schemas pandas would load differently."""
+    if any(pa.types.is_binary(field.type) for field in schema):
+        # Arrow types non-UTF-8 text (e.g. Shift-JIS) as binary instead of
+        # failing; let pandas raise its decode error for the user.
+        raise pa.ArrowInvalid("CSV contains text that is not valid UTF-8")
+    if len(set(schema.names)) != len(schema.names):
+        # pandas renames repeated headers (ward, ward.1); Arrow keeps both.
+        raise pa.ArrowInvalid("CSV has duplicate column names")
+
+
+def _temporal_columns(schema: "pa.Schema") -> list:
+    return [field.name for field in schema if pa.types.is_temporal(field.type)]
+
+
+def _read_arrow_csv(payload: bytes) -> pd.DataFrame:
+    table = pacsv.read_csv(
+        pa.BufferReader(payload), convert_options=_arrow_convert_options()
+    )
+    _check_arrow_schema(table.schema)
+    temporal = _temporal_columns(table.schema)
+    if temporal:
+        # Re-parse only the temporal columns as text and swap them in, so a
+        # second copy of the whole table is never built.
+        text = pacsv.read_csv(
+            pa.BufferReader(payload),
+            convert_options=_arrow_convert_options(temporal, include_columns=temporal),
+        )
+        for name in temporal:
+            index = table.schema.get_field_index(name)
+            table = table.set_column(index, name, text.column(name))
+    return table.to_pandas()
+
+
+def _read_large_csv(payload: bytes) -> pd.DataFrame:
+    """Parse a big CSV upload, inferring column types block by block."""
+    if pacsv is not None:
+        read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_BYTES)
+        try:
+            reader = pacsv.open_csv(
+                pa.BufferReader(payload),
+                read_options=read_options,
+                convert_options=_arrow_convert_options(),
+            )
+            _check_arrow_schema(reader.schema)
+            temporal = _temporal_columns(reader.schema)
+            if temporal:
+                reader = pacsv.open_csv(
+                    pa.BufferReader(payload),
+                    read_options=read_options,
+                    convert_options=_arrow_convert_options(temporal),
+                )
+            # Collect the batches as one Arrow table and convert once;
+            # concatenating per-batch frames costs more peak memory.
+            return reader.read_all().to_pandas()
+        except pa.ArrowInvalid:
+            # Types are inferred from the first block; fall back when later
+            # blocks disagree or the schema is one pandas reads differently.
+            pass
+    reader = pd.read_csv(io.BytesIO(payload), chunksize=CSV_CHUNK_ROWS)
+    return pd.concat(reader, ignore_index=True)
+
+
+def _read_table(payload: bytes, filename: str) -> pd.DataFrame:
     if filename.endswith(".csv"):
-        return pd.read_csv(uploaded_file)
+        if len(payload) > LARGE_UPLOAD_BYTES:
+            return _read_large_csv(payload)
+        if pacsv is not None:
+            # Hand the upload's buffer to Arrow directly instead of streaming it
+            # through a Python file object.
+            try:
+                return _read_arrow_csv(payload)
+            except pa.ArrowInvalid:
+                # Arrow is stricter than pandas about ragged rows and quoting,
+                # and _check_arrow_schema rejects files pandas reads
+                # differently; let the C engine decide before reporting.
+                pass
+        return pd.read_csv(io.BytesIO(payload))
     if filename.endswith((".xlsx", ".xls")):
-        return pd.read_excel(uploaded_file)
+        try:
+            return pd.read_excel(io.BytesIO(payload), engine="calamine")
+        except ImportError:  # pragma: no cover - python-calamine not installed
+            return pd.read_excel(io.BytesIO(payload))
     raise ValueError("Unsupported file type. Please upload a CSV or Excel file.")
 
 
+def _categorize_repeated_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """Store text columns made of repeated values (wards, crime types) as categoricals."""
+    for col in df.select_dtypes(include=["object", "string"]).columns:
+        if df[col].nunique() <= len(df) * CATEGORY_MAX_UNIQUE_RATIO:
+            df[col] = df[col].astype("category")
+    return df
+
+
+@st.cache_data(
+    show_spinner="読み込み中…",
+    max_entries=UPLOAD_CACHE_ENTRIES,
+    ttl=UPLOAD_CACHE_TTL_SECONDS,
+)
+def _parse_tabular_bytes(file_key: str, filename: str, _payload: bytes) -> pd.DataFrame:
+    # The leading underscore keeps Streamlit from hashing the payload on every
+    # rerun; file_key identifies the contents instead.
+    return _categorize_repeated_strings(_read_table(_payload, filename))
+
+
+def upload_key(uploaded_file: io.BytesIO) -> str:
+    """Return a cache key identifying the contents of an upload."""
+    file_key = getattr(uploaded_file, "file_id", None)
+    if not file_key:
+        file_key = hashlib.blake2b(
+            uploaded_file.getvalue(), digest_size=16
+        ).hexdigest()
+    return file_key
+
+
+def load_tabular_file(uploaded_file: io.BytesIO) -> pd.DataFrame:
+    """Return a dataframe from a CSV or Excel file.
+
+    Parsing is memoized per upload so Streamlit reruns triggered by widget
+    changes do not re-read the file.
+    """
+    return _parse_tabular_bytes(
+        upload_key(uploaded_file), uploaded_file.name.lower(), uploaded_file.getvalue()
+    )
+
+
+def select_renamed(df: pd.DataFrame, columns: list, rename_map: dict) -> pd.DataFrame:
+    """Return ``columns`` of ``df`` under their display names without copying data.
+
+    A column picked for several roles is emitted once, under its last name.
+    """
+    return pd.DataFrame(
+        {rename_map[col]: df[col].array for col in dict.fromkeys(columns)},
+        index=df.index,
+        copy=False,
+    )
+
+
 def summarize_records(
     df: pd.DataFrame,
     ward_col: str,
@@ -35,7 +225,71 @@ def summarize_records(
         columns.append(summary_col)
         rename_map[summary_col] = "概要"
 
-    return df[columns].rename(columns=rename_map)
+    return select_renamed(df, columns, rename_map)
+
+
+def score_summaries(
+    selected_summary: str, summaries: Sequence[str], min_score: float = 0.0
+) -> np.ndarray:
+    """Return similarity scores in [0, 1] between the selection and each summary.
+
+    Scores below ``min_score`` may be reported as 0 when that lets the scorer
+    bail out early.
+    """
+    if process is not None:
+        # cdist splits work across threads by query row, so pass the candidates
+        # as queries to let every worker take a share of the scan.
+        scores = process.cdist(
+            summaries,
+            [selected_summary],
+            scorer=fuzz.ratio,
+            score_cutoff=min_score * 100,
+            workers=-1,
+        )
+        return scores[:, 0] / 100.0
+
+    # SequenceMatcher indexes its second sequence (b2j), so keep the selected
+    # summary there and only swap the candidate side between rows. ratio() is
+    # not symmetric, so these scores can differ from ratio(selected, summary).
+    matcher = SequenceMatcher(None, b=selected_summary)
+
+    def similarity(summary: str) -> float:
+        matcher.set_seq1(summary)
+        # Both quick ratios are upper bounds on ratio() and cost O(n + m), so
+        # candidates that cannot reach min_score skip the full comparison.
+        if matcher.real_quick_ratio() < min_score or matcher.quick_ratio() < min_score:
+            return 0.0
+        return matcher.ratio()
+
+    return np.fromiter(map(similarity, summaries), dtype=float, count=len(summaries))
+
+
+def sorted_options(series: pd.Series) -> list:
+    """Return the distinct non-null values of a column in sorted order."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Categories inferred at load time are already unique and sorted.
+        return series.cat.categories.tolist()
+    return sorted(series.dropna().unique())
+
+
+@st.cache_data(
+    show_spinner=False, max_entries=UPLOAD_CACHE_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS
+)
+def summarize_wards(file_key: str, ward_col: str, _df: pd.DataFrame) -> pd.DataFrame:
+    """Return record counts per ward, most frequent first."""
+    return _df[ward_col].value_counts().rename_axis(ward_col).reset_index(name="件数")
+
+
+@st.cache_data(
+    show_spinner=False, max_entries=UPLOAD_CACHE_ENTRIES, ttl=UPLOAD_CACHE_TTL_SECONDS
+)
+def ward_row_positions(file_key: str, ward_col: str, _df: pd.DataFrame) -> dict:
+    """Return a mapping of ward name to the row positions belonging to it.
+
+    The cache is keyed on the upload rather than the frame so lookups do not
+    hash every row on each rerun.
+    """
+    return _df.groupby(ward_col, sort=False, observed=True).indices
 
 
 def compute_related_cases(
@@ -51,40 +305,56 @@ def compute_related_cases(
     if not summary_col or summary_col not in df.columns or not selected_summary:
         return pd.DataFrame()
 
-    candidates = df[df[ward_col] == selected_ward]
+    # Combine every row condition into one mask so only a single filtered
+    # copy of the frame is materialized.
+    mask = (df[ward_col] == selected_ward).to_numpy(copy=True)
     if crime_col and selected_crime:
-        candidates = candidates[candidates[crime_col] == selected_crime]
+        mask &= (df[crime_col] == selected_crime).to_numpy()
+    mask &= df[summary_col].notna().to_numpy()
 
-    candidates = candidates.dropna(subset=[summary_col])
+    candidates = df[mask]
     if candidates.empty:
         return pd.DataFrame()
 
-    def similarity(summary: str) -> float:
-        return SequenceMatcher(None, selected_summary, summary).ratio()
-
-    scored = candidates.assign(_score=candidates[summary_col].apply(similarity))
-    scored = scored[scored[summary_col] != selected_summary]
-    scored = scored[scored["_score"] >= 0.3]
-    if scored.empty:
+    # Incident summaries repeat a lot, so score each distinct text once and
+    # broadcast the results back to the rows through the factorized codes.
+    codes, unique_summaries = pd.factorize(candidates[summary_col])
+    unique_scores = score_summaries(
+        str(selected_summary),
+        [str(summary) for summary in unique_summaries],
+        min_score=RELATED_MIN_SCORE,
+    )
+    scores = unique_scores[codes]
+    keep = scores >= RELATED_MIN_SCORE
+    keep &= (candidates[summary_col] != selected_summary).to_numpy()
+    positions = np.flatnonzero(keep)
+    if positions.size == 0:
         return pd.DataFrame()
 
-    scored = scored.sort_values("_score", ascending=False).head(top_n)
-    return scored.drop(columns="_score")
+    # Select the top_n best scores with a linear-time partition and only sort
+    # those survivors, instead of sorting every candidate.
+    kept_scores = scores[positions]
+    if positions.size > top_n:
+        best = np.argpartition(-kept_scores, top_n)[:top_n]
+    else:
+        best = np.arange(positions.size)
+    best = best[np.argsort(-kept_scores[best], kind="stable")]
+    return candidates.iloc[positions[best]]
 
 
 def display_map(
     df: pd.DataFrame,
     lat_col: Optional[str],
     lon_col: Optional[str],
-    ward_col: str,
-    selected_ward: str,
 ):
     st.subheader("東京都全域マップ")
     if lat_col and lon_col and lat_col in df.columns and lon_col in df.columns:
-        map_df = df[[lat_col, lon_col, ward_col]].rename(
-            columns={lat_col: "lat", lon_col: "lon", ward_col: "区"}
-        )
-        st.map(map_df)
+        # st.map only plots lat/lon, so build just those two columns and drop
+        # rows without usable coordinates in a single mask.
+        lat = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(dtype=float)
+        lon = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(dtype=float)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+        st.map(pd.DataFrame({"lat": lat[valid], "lon": lon[valid]}))
     else:
         st.info(
             "位置情報の列が選択されていないため、東京都心部を仮表示しています。"
@@ -129,18 +399,21 @@ related_col = st.selectbox("関連事例の列を選択 (任意)", [None] + colu
 lat_col = st.selectbox("緯度の列を選択 (任意)", [None] + columns)
 lon_col = st.selectbox("経度の列を選択 (任意)", [None] + columns)
 
-wards = sorted(data[ward_col].dropna().unique())
+wards = sorted_options(data[ward_col])
 selected_ward = st.selectbox("表示する区を選択", wards)
 
 crime_options = ["すべて"]
 if crime_col:
-    crime_options += sorted(data[crime_col].dropna().unique())
+    crime_options += sorted_options(data[crime_col])
 selected_crime = st.selectbox("犯罪種別を絞り込み", crime_options)
 selected_crime_value = (
     selected_crime if (crime_col and selected_crime != "すべて") else None
 )
 
-filtered_df = data[data[ward_col] == selected_ward]
+file_key = upload_key(uploaded)
+ward_rows = ward_row_positions(file_key, ward_col, data).get(selected_ward, [])
+ward_df = data.iloc[ward_rows]
+filtered_df = ward_df
 if crime_col and selected_crime_value:
     filtered_df = filtered_df[filtered_df[crime_col] == selected_crime_value]
 
@@ -151,16 +424,11 @@ lower_left, lower_right = st.columns((1, 1))
 selected_summary_value: Optional[str] = None
 
 with upper_left:
-    display_map(data, lat_col, lon_col, ward_col, selected_ward)
+    display_map(data, lat_col, lon_col)
 
 with lower_left:
     st.subheader("区ごとの一覧")
-    ward_summary = (
-        data.groupby(ward_col)
-        .size()
-        .reset_index(name="件数")
-        .sort_values("件数", ascending=False)
-    )
+    ward_summary = summarize_wards(file_key, ward_col, data)
     ward_summary_display = ward_summary.rename(columns={ward_col: "区"})
     st.dataframe(ward_summary_display, use_container_width=True)
 
@@ -178,7 +446,7 @@ with upper_right:
             st.info("該当する概要がありません。条件を変更してください。")
             selected_summary_value = None
         else:
-            summary_choices = summaries[summary_col].dropna().unique().tolist()
+            summary_choices = summaries[summary_col].unique().tolist()
             selected_summary_value = st.selectbox(
                 "表示する概要を選択",
                 summary_choices,
@@ -190,8 +458,10 @@ with upper_right:
             if crime_col:
                 detail_columns.append(crime_col)
             detail_columns.append(summary_col)
+            # Take the matching rows and only the displayed columns in one step.
+            matches = (summaries[summary_col] == selected_summary_value).to_numpy()
             detail_df = summarize_records(
-                summaries[summaries[summary_col] == selected_summary_value],
+                summaries.loc[matches, list(dict.fromkeys(detail_columns))],
                 ward_col,
                 crime_col,
                 summary_col,
@@ -209,7 +479,7 @@ with upper_right:
 with lower_right:
     st.subheader("関連事例")
     related_cases = compute_related_cases(
-        data,
+        ward_df,
         ward_col,
         summary_col,
         selected_ward,
@@ -245,7 +515,7 @@ with lower_right:
             display_columns.append(related_col)
             rename_map[related_col] = "関連事例"
 
-        display_df = related_cases[display_columns].rename(columns=rename_map)
+        display_df = select_renamed(related_cases, display_columns, rename_map)
         st.dataframe(display_df, use_container_width=True)
 
 st.caption("データの列を選択して、希望のビューを作成してください。")